@@ -0,0 +1,393 @@
+import streamlit as st
+import openai
+import orjson
+import threading
+from concurrent.futures import Future, wait
+import html
+import functools
+from datetime import date, timedelta
+from string import Template
+
+# Initialize session state
+def init_session_state():
+    if 'offer_params' not in st.session_state:
+        st.session_state.offer_params = None
+    if 'offer_created' not in st.session_state:
+        st.session_state.offer_created = False
+    if 'adjusted_params' not in st.session_state:
+        st.session_state.adjusted_params = None
+    if 'audio_bytes' not in st.session_state:
+        st.session_state.audio_bytes = None
+    if 'transcribed_text' not in st.session_state:
+        st.session_state.transcribed_text = ""
+    if 'end_date_key' not in st.session_state:
+        st.session_state.end_date_key = None
+    if 'end_date_str' not in st.session_state:
+        st.session_state.end_date_str = ""
+
+# Supported offer types, with a precomputed index for the editor selectbox
+OFFER_TYPES = ("cashback", "discount", "free_shipping")
+OFFER_TYPE_INDEX = {offer_type: i for i, offer_type in enumerate(OFFER_TYPES)}
+
+# Helper function for consistent dollar formatting
+def format_currency(amount):
+    return f"\\${amount}"  # Escaped for Markdown
+
+# Reuse one OpenAI client (and its connection pool) per API key. A cheap
+# request in the background opens the TLS connection before the first
+# real call needs it
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key):
+    client = openai.OpenAI(api_key=api_key)
+    threading.Thread(target=_warm_openai_client, args=(client,), daemon=True).start()
+    return client
+
+def _warm_openai_client(client):
+    try:
+        client.models.list()
+    except Exception:
+        pass  # Real requests will surface any problem with the key
+
+# JSON schema the extraction model is constrained to (structured outputs)
+OFFER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "offer_type": {"type": "string", "enum": list(OFFER_TYPES)},
+        "value_type": {"type": "string", "enum": ["percentage", "fixed"]},
+        "value": {"type": "number"},
+        "min_spend": {"type": "number"},
+        "duration_days": {"type": "integer"},
+        "audience": {"type": "string"},
+        "offer_name": {"type": "string"},
+        "max_redemptions": {"type": ["integer", "null"]},
+        "conditions": {"type": "array", "items": {"type": "string"}},
+        "description": {"type": "string"}
+    },
+    "required": [
+        "offer_type", "value_type", "value", "min_spend", "duration_days",
+        "audience", "offer_name", "max_redemptions", "conditions", "description"
+    ],
+    "additionalProperties": False
+}
+
+# Schema for several offers extracted in one call, in prompt order
+OFFER_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"offers": {"type": "array", "items": OFFER_SCHEMA}},
+    "required": ["offers"],
+    "additionalProperties": False
+}
+
+EXTRACTION_PROMPT = """Extract offer details. Return JSON with:
+{
+    "offer_type": "cashback/discount/free_shipping",
+    "value_type": "percentage/fixed",
+    "value": 20,
+    "min_spend": 500,
+    "duration_days": 7,
+    "audience": "all/premium/etc",
+    "offer_name": "creative name",
+    "max_redemptions": null,
+    "conditions": [],
+    "description": "marketing text"
+}"""
+
+EXTRACTION_BATCH_PROMPT = EXTRACTION_PROMPT + """
+The user message is a JSON array of offer descriptions. Return {"offers": [...]}
+with exactly one offer object per description, in the same order."""
+
+# Chat completion arguments for a single offer extraction
+def extraction_request(prompt):
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "offer", "schema": OFFER_SCHEMA, "strict": True}
+        },
+    )
+
+# Chat completion arguments for extracting several prompts in one call
+def batch_extraction_request(prompts):
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": EXTRACTION_BATCH_PROMPT},
+            {"role": "user", "content": orjson.dumps(prompts).decode()},
+        ],
+        temperature=0.2,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "offers", "schema": OFFER_BATCH_SCHEMA, "strict": True}
+        },
+    )
+
+# Single extraction call; streamed chunks are handed to on_delta
+def stream_offer_parameters(prompt, api_key, on_delta=None):
+    client = get_openai_client(api_key)
+    response = client.chat.completions.create(**extraction_request(prompt), stream=True)
+    content = ""
+    for chunk in response:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content or ""
+            content += delta
+            if on_delta:
+                on_delta(delta)
+    if not content:
+        raise ValueError("The model returned no offer details")
+    return orjson.loads(content)
+
+# One extraction call for up to ExtractionBatcher.MAX_BATCH prompts
+def request_offer_batch(prompts, api_key):
+    response = get_openai_client(api_key).chat.completions.create(**batch_extraction_request(prompts))
+    content = response.choices[0].message.content if response.choices else None
+    if not content:
+        raise ValueError("The model returned no offer details")
+    offers = orjson.loads(content)["offers"]
+    if len(offers) != len(prompts):
+        raise ValueError(f"Expected {len(prompts)} offers, got {len(offers)}")
+    return offers
+
+# Groups extraction requests for the same API key. While a call is in
+# flight, new prompts queue up; when it returns, the queue goes out as
+# batched calls of up to MAX_BATCH prompts. A lone request is sent straight
+# away (and streamed). This saves API calls at the cost of latency for
+# queued requests: they wait for the in-flight call to finish, and a batch
+# decodes the output for all of its offers in one call. Every request runs
+# on its own thread (see run_in_thread), so queued requests block only
+# themselves, never calls for other keys
+class ExtractionBatcher:
+    MAX_BATCH = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # api_key -> [(prompt, Future)] while a call is in flight
+
+    def extract(self, prompt, api_key, on_delta=None):
+        with self._lock:
+            queue = self._pending.get(api_key)
+            if queue is not None:
+                future = Future()
+                queue.append((prompt, future))
+            else:
+                self._pending[api_key] = []
+                future = None
+        if future is not None:
+            return future.result()
+        try:
+            return stream_offer_parameters(prompt, api_key, on_delta)
+        finally:
+            threading.Thread(target=self._drain, args=(api_key,), daemon=True).start()
+
+    def _drain(self, api_key):
+        while True:
+            with self._lock:
+                queue = self._pending[api_key]
+                if not queue:
+                    del self._pending[api_key]
+                    return
+                batch = queue[:self.MAX_BATCH]
+                del queue[:self.MAX_BATCH]
+            try:
+                offers = request_offer_batch([prompt for prompt, _ in batch], api_key)
+            except ValueError:
+                # A malformed batch reply shouldn't fail every queued user, so
+                # retry each prompt on its own, in parallel
+                retries = [
+                    run_in_thread(stream_offer_parameters, prompt, api_key)
+                    for prompt, _ in batch
+                ]
+                for (_, future), retry in zip(batch, retries):
+                    error = retry.exception()
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(retry.result())
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), offer in zip(batch, offers):
+                    future.set_result(offer)
+
+@st.cache_resource(show_spinner=False)
+def get_extraction_batcher():
+    return ExtractionBatcher()
+
+# Extractions are cached on the normalized prompt; errors raise instead of
+# returning None so that failures are never cached. Nothing in here calls
+# Streamlit, so it can run on a worker thread
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_offer_parameters(normalized_prompt, _prompt, _api_key, _on_delta=None):
+    return get_extraction_batcher().extract(_prompt, _api_key, _on_delta)
+
+# Run fn(*args) on its own daemon thread and return a Future for the result.
+# Each call gets a fresh thread, so one session's calls never queue behind
+# another's the way they would in a shared, fixed-size pool
+def run_in_thread(fn, *args):
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+# Enhanced extraction function. The API call runs on a worker thread while
+# this thread shows a skeleton card and the JSON streaming in
+def extract_offer_parameters(prompt, api_key):
+    chunks = []
+    future = run_in_thread(
+        _cached_offer_parameters, prompt.strip().lower(), prompt, api_key, chunks.append
+    )
+    preview = st.empty()
+    with preview.container():
+        display_offer_skeleton()
+        placeholder = st.empty()
+        shown = 0
+        while not wait([future], timeout=0.1).done:
+            if len(chunks) > shown:
+                shown = len(chunks)
+                placeholder.code("".join(chunks[:shown]), language="json")
+    preview.empty()
+    try:
+        return future.result()
+    except Exception as e:
+        st.error(f"Extraction error: {str(e)}")
+        return None
+
+# Dynamic offer editor
+def offer_editor():
+    # Batch edits in a form so the script reruns once per Apply, not per keystroke
+    with st.form("offer_form", clear_on_submit=False):
+        cols = st.columns(2)
+        with cols[0]:
+            st.session_state.adjusted_params["offer_name"] = st.text_input(
+                "Offer Name", 
+                value=st.session_state.adjusted_params.get("offer_name", "")
+            )
+            st.session_state.adjusted_params["offer_type"] = st.selectbox(
+                "Type",
+                OFFER_TYPES,
+                index=OFFER_TYPE_INDEX.get(
+                    st.session_state.adjusted_params.get("offer_type", "cashback"), 0
+                )
+            )
+            st.session_state.adjusted_params["value"] = st.number_input(
+                "Percentage (%)" if st.session_state.adjusted_params.get("value_type") == "percentage" else "Amount ($)",
+                value=st.session_state.adjusted_params.get("value", 0),
+                key="value_input"
+            )
+
+        with cols[1]:
+            st.session_state.adjusted_params["min_spend"] = st.number_input(
+                "Minimum Spend ($)",
+                value=st.session_state.adjusted_params.get("min_spend", 0),
+                key="min_spend_input"
+            )
+            st.session_state.adjusted_params["duration_days"] = st.number_input(
+                "Duration (Days)",
+                value=st.session_state.adjusted_params.get("duration_days", 7),
+                key="duration_input"
+            )
+            if st.session_state.adjusted_params.get("max_redemptions"):
+                st.session_state.adjusted_params["max_redemptions"] = st.number_input(
+                    "Max Redemptions",
+                    value=st.session_state.adjusted_params.get("max_redemptions"),
+                    key="max_redemptions_input"
+                )
+
+        st.form_submit_button("Apply")
+
+# Editor and preview rerun together on Apply, without the rest of the page
+@st.fragment
+def offer_editor_fragment():
+    offer_editor()
+
+    # Display the CURRENTLY EDITED offer
+    display_offer(st.session_state.adjusted_params)
+
+# Offer card layout, built once and filled in on every render. It is emitted
+# with st.html, which skips the markdown parser entirely
+_OFFER_ICON_TEMPLATE = Template("<h1 style='text-align: center;'>$icon</h1>")
+_OFFER_TEMPLATE = Template("""<div>
+<b>✨ $offer_name</b><br>
+💵 <b>$value</b> $offer_type<br>
+🛒 Min. spend: <b>$min_spend</b><br>
+⏳ Valid until: <b>$end_date</b><br>
+👥 For: <b>$audience</b>
+$conditions
+</div>""")
+
+# End date label for an offer lasting `duration_days` from the given day
+@functools.lru_cache(maxsize=64)
+def format_end_date(duration_days, today_ordinal):
+    return (date.fromordinal(today_ordinal) + timedelta(days=duration_days)).strftime('%b %d, %Y')
+
+# "Valid until" label kept in session state, reformatted only when the
+# duration or the current day changes, so it never goes stale past midnight
+def end_date_label(duration_days):
+    key = (int(duration_days), date.today().toordinal())
+    if st.session_state.end_date_key != key:
+        st.session_state.end_date_key = key
+        st.session_state.end_date_str = format_end_date(*key)
+    return st.session_state.end_date_str
+
+# Placeholder card shown while the offer is being extracted
+def display_offer_skeleton():
+    st.subheader("🎉 Your Created Offer")
+    cols = st.columns([1, 3])
+    with cols[0]:
+        st.html(_OFFER_ICON_TEMPLATE.substitute(icon="⏳"))
+    with cols[1]:
+        st.html(_OFFER_TEMPLATE.substitute(
+            offer_name="Generating...",
+            value="…",
+            offer_type="",
+            min_spend="…",
+            end_date="…",
+            audience="…",
+            conditions=""
+        ))
+
+# Offer display component
+def display_offer(params):
+    if params.get("value_type") == "percentage":
+        value_display = f"{params['value']}%"
+    else:
+        value_display = f"${params['value']}"
+    conditions = params.get("conditions") or ()
+    conditions_html = ""
+    if conditions:
+        items = "".join(f"<li>{html.escape(str(c))}</li>" for c in conditions)
+        conditions_html = f"<p><b>Conditions:</b></p><ul>{items}</ul>"
+
+    with st.container():
+        st.markdown("---")
+        st.subheader("🎉 Your Created Offer")
+        cols = st.columns([1, 3])
+
+        with cols[0]:
+            icon = "💰" if params.get("offer_type") == "cashback" else "🏷️"
+            st.html(_OFFER_ICON_TEMPLATE.substitute(icon=icon))
+
+        with cols[1]:
+            st.html(_OFFER_TEMPLATE.substitute(
+                offer_name=html.escape(str(params.get('offer_name', 'Special Offer'))),
+                value=html.escape(value_display),
+                offer_type=html.escape(str(params.get('offer_type'))),
+                min_spend=html.escape(f"${params.get('min_spend', 0)}"),
+                end_date=end_date_label(params.get("duration_days", 7)),
+                audience=html.escape(params.get('audience', 'all customers').title()),
+                conditions=conditions_html
+            ))
+
+    st.markdown("---")
+    st.success("Offer updated successfully!")
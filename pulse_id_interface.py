@@ -1,43 +1,147 @@
 import streamlit as st
-import openai
-import json
-import re
-from datetime import datetime, timedelta
+import io
+import os
+import hashlib
+import wave
+import numpy as np
 from audio_recorder_streamlit import audio_recorder
-import base64
-
-# Initialize session state
-if 'offer_params' not in st.session_state:
-    st.session_state.offer_params = None
-if 'offer_created' not in st.session_state:
-    st.session_state.offer_created = False
-if 'adjusted_params' not in st.session_state:
-    st.session_state.adjusted_params = None
-if 'audio_bytes' not in st.session_state:
-    st.session_state.audio_bytes = None
-if 'transcribed_text' not in st.session_state:
-    st.session_state.transcribed_text = ""
-
-# Helper function for consistent dollar formatting
-def format_currency(amount):
-    return f"\\${amount}"  # Escaped for Markdown
-
-# Function to transcribe audio using OpenAI Whisper
+import ctranslate2
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+from offer_common import (
+    init_session_state,
+    format_currency,
+    get_openai_client,
+    extract_offer_parameters,
+    offer_editor_fragment,
+    run_in_thread,
+)
+
+init_session_state()
+
+# Load the local Whisper model and warm it up on a second of silence, so
+# kernel selection and other one-time setup happen here rather than on the
+# first real transcription
+def _build_whisper_pipeline(device, compute_type, flash_attention):
+    model = WhisperModel(
+        # English-only distilled small: small's encoder with a 2-layer decoder,
+        # lighter and faster than small for short English clips
+        "distil-small.en",
+        device=device,
+        compute_type=compute_type,
+        flash_attention=flash_attention
+    )
+    pipeline = BatchedInferencePipeline(model=model)
+    segments, _ = pipeline.transcribe(
+        np.zeros(16000, dtype=np.float32),
+        language="en",
+        task="transcribe",
+        batch_size=1,
+        clip_timestamps=[{"start": 0, "end": 1}]
+    )
+    list(segments)
+    return pipeline
+
+# Weights are quantized to int8 on both devices; on GPU, activations stay
+# fp16. CTranslate2's FlashAttention kernels need an Ampere or newer GPU
+# (the same generation that added bf16), so they are only requested there.
+# If CTranslate2 still rejects them at load or warm-up time, the model is
+# rebuilt without them
+def _load_whisper_pipeline():
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    compute_type = "int8_float16" if device == "cuda" else "int8"
+    flash_attention = (
+        device == "cuda" and "bfloat16" in ctranslate2.get_supported_compute_types("cuda")
+    )
+    try:
+        return _build_whisper_pipeline(device, compute_type, flash_attention)
+    except (RuntimeError, ValueError, TypeError):
+        if not flash_attention:
+            raise
+        return _build_whisper_pipeline(device, compute_type, False)
+
+# Share one Whisper pipeline across sessions. It loads on a background
+# thread, so no page run blocks on the model download
+@st.cache_resource(show_spinner=False)
+def _whisper_pipeline_future():
+    return run_in_thread(_load_whisper_pipeline)
+
+def get_whisper_pipeline():
+    return _whisper_pipeline_future().result()
+
+# Transcription backend: "local" (faster-whisper) or "openai" (whisper-1 API)
+WHISPER_BACKENDS = ("local", "openai")
+WHISPER_BACKEND = os.environ.get("WHISPER_BACKEND", "local").strip().lower()
+if WHISPER_BACKEND not in WHISPER_BACKENDS:
+    raise ValueError(
+        f"WHISPER_BACKEND must be one of {', '.join(WHISPER_BACKENDS)}, "
+        f"got {os.environ['WHISPER_BACKEND']!r}"
+    )
+
+# In-memory upload for the whisper-1 API. The recording is re-encoded as
+# 16kHz mono 16-bit PCM, which is what Whisper resamples to anyway, so the
+# upload is several times smaller than the recorder's 44.1/48kHz output.
+# The SDK takes the filename from .name
+def audio_upload_file(audio_bytes):
+    audio = decode_audio(io.BytesIO(audio_bytes), sampling_rate=16000)
+    pcm16 = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    audio_file = io.BytesIO()
+    with wave.open(audio_file, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(pcm16.tobytes())
+    audio_file.seek(0)
+    audio_file.name = "audio.wav"
+    return audio_file
+
+# Transcribe with the local model. Silero VAD (bundled with faster-whisper)
+# runs once up front: silent recordings never reach the model. Only the
+# spoken ranges are kept; collect_chunks concatenates them into chunks of at
+# most 30s, and each chunk is one clip for the pipeline
+def transcribe_segments_locally(audio_bytes):
+    # Decode in memory to 16kHz mono float32, as expected by the model
+    audio = decode_audio(io.BytesIO(audio_bytes), sampling_rate=16000)
+    speech = get_speech_timestamps(
+        audio, VadOptions(max_speech_duration_s=30, min_silence_duration_ms=160)
+    )
+    if not speech:
+        return iter(())
+    chunks, _ = collect_chunks(audio, speech, max_duration=30)
+    clip_timestamps, offset = [], 0
+    for chunk in chunks:
+        clip_timestamps.append({"start": offset / 16000, "end": (offset + len(chunk)) / 16000})
+        offset += len(chunk)
+    # Offers are described in English, so skip the language detection pass.
+    # Up to 30s of speech is a single chunk, which needs no batching
+    segments, _ = get_whisper_pipeline().transcribe(
+        np.concatenate(chunks),
+        language="en",
+        task="transcribe",
+        batch_size=min(8, len(clip_timestamps)),
+        clip_timestamps=clip_timestamps
+    )
+    return segments
+
+# Transcriptions are cached on a digest of the recording, so re-submitting
+# the same audio skips the model; underscored args are not hashed
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_transcription(audio_digest, _audio_bytes, _api_key):
+    if WHISPER_BACKEND == "openai":
+        transcription = get_openai_client(_api_key).audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_upload_file(_audio_bytes)
+        )
+        return transcription.text
+
+    segments = transcribe_segments_locally(_audio_bytes)
+    return "".join(segment.text for segment in segments).strip()
+
+# Function to transcribe audio with Whisper
 def transcribe_audio_with_whisper(audio_bytes, api_key):
     try:
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Save audio to a temporary file
-        audio_file = "temp_audio.wav"
-        with open(audio_file, "wb") as f:
-            f.write(audio_bytes)
-        
-        with open(audio_file, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-            return transcription.text
+        audio_digest = hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+        return _cached_transcription(audio_digest, audio_bytes, api_key)
     except Exception as e:
         st.error(f"Error transcribing audio: {str(e)}")
         return None
@@ -54,20 +158,65 @@ if not openai_api_key:
     st.warning("Please enter your OpenAI API key to proceed.")
     st.stop()
 
-# Voice input section
-st.subheader("🎤 Speak Your Offer")
-audio_bytes = audio_recorder("Click to record your offer (2+ seconds):", pause_threshold=2.0)
+# Start warming up the models now so the first click doesn't pay for it.
+# The Whisper model loads in the background; if it fails, only voice input
+# is affected and typed offers keep working
+get_openai_client(openai_api_key)
+if WHISPER_BACKEND == "local":
+    whisper_future = _whisper_pipeline_future()
+    if whisper_future.done() and whisper_future.exception() is not None:
+        st.warning(
+            f"Voice transcription is unavailable, the Whisper model failed to load: "
+            f"{whisper_future.exception()}. You can still type your offer below."
+        )
+        # Forget the failed load so the next run tries again
+        _whisper_pipeline_future.clear()
 
-if audio_bytes:
-    st.session_state.audio_bytes = audio_bytes
-    st.audio(audio_bytes, format="audio/wav")
-    
-    if st.button("Transcribe with OpenAI Whisper"):
-        with st.spinner("Transcribing your voice..."):
-            transcription = transcribe_audio_with_whisper(audio_bytes, openai_api_key)
-            if transcription:
-                st.session_state.transcribed_text = transcription
-                st.success("Transcription complete! Edit the text below if needed.")
+# Voice input section. Recording and transcribing run in a fragment, so
+# pressing record/stop only reruns this part of the page
+@st.fragment
+def recorder_fragment():
+    audio_bytes = audio_recorder("Click to record your offer (2+ seconds):", pause_threshold=2.0)
+
+    if audio_bytes:
+        st.session_state.audio_bytes = audio_bytes
+        st.audio(audio_bytes, format="audio/wav")
+
+        cols = st.columns(2)
+        with cols[0]:
+            transcribe_clicked = st.button("Transcribe with Whisper")
+        with cols[1]:
+            generate_clicked = st.button("Transcribe & Generate Offer")
+
+        if transcribe_clicked:
+            with st.spinner("Transcribing your voice..."):
+                transcription = transcribe_audio_with_whisper(audio_bytes, openai_api_key)
+                if transcription:
+                    st.session_state.transcribed_text = transcription
+                    st.toast("Transcription complete! Edit the text below if needed.")
+                    # Full rerun so the description box picks up the text
+                    st.rerun()
+                elif transcription is not None:
+                    st.warning("No speech was detected in the recording. Please try again.")
+
+        # Transcribe and extract with a single click, through the same cached,
+        # streamed paths as the individual Transcribe and Generate buttons
+        if generate_clicked:
+            with st.spinner("Transcribing and creating your offer..."):
+                transcription = transcribe_audio_with_whisper(audio_bytes, openai_api_key)
+                if transcription:
+                    offer_params = extract_offer_parameters(transcription, openai_api_key)
+                    st.session_state.transcribed_text = transcription
+                    if offer_params:
+                        st.session_state.offer_params = offer_params
+                        st.session_state.adjusted_params = offer_params.copy()
+                        st.session_state.offer_created = True
+                        st.rerun()
+                elif transcription is not None:
+                    st.warning("No speech was detected in the recording. Please try again.")
+
+st.subheader("🎤 Speak Your Offer")
+recorder_fragment()
 
 # Text input section that shows transcription or allows manual input
 st.subheader("✏️ Offer Description")
@@ -79,137 +228,27 @@ user_prompt = st.text_area(
     help="Edit this text if needed, or type your offer directly"
 )
 
-# Enhanced extraction function
-def extract_offer_parameters(prompt, api_key):
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Extract offer details. Return JSON with:
-                    {
-                        "offer_type": "cashback/discount/free_shipping",
-                        "value_type": "percentage/fixed",
-                        "value": 20,
-                        "min_spend": 500,
-                        "duration_days": 7,
-                        "audience": "all/premium/etc",
-                        "offer_name": "creative name",
-                        "max_redemptions": null,
-                        "conditions": [],
-                        "description": "marketing text"
-                    }"""
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-        )
-        if response and response.choices:
-            content = response.choices[0].message.content.strip()
-            content = re.sub(r'```json\n?(.*?)\n?```', r'\1', content, flags=re.DOTALL)
-            return json.loads(content)
-        return None
-    except Exception as e:
-        st.error(f"Extraction error: {str(e)}")
-        return None
-
-# Dynamic offer editor
-def offer_editor():
-    cols = st.columns(2)
-    with cols[0]:
-        st.session_state.adjusted_params["offer_name"] = st.text_input(
-            "Offer Name", 
-            value=st.session_state.adjusted_params.get("offer_name", "")
-        )
-        st.session_state.adjusted_params["offer_type"] = st.selectbox(
-            "Type",
-            ["cashback", "discount", "free_shipping"],
-            index=["cashback", "discount", "free_shipping"].index(
-                st.session_state.adjusted_params.get("offer_type", "cashback")
-            )
-        )
-        st.session_state.adjusted_params["value"] = st.number_input(
-            "Percentage (%)" if st.session_state.adjusted_params.get("value_type") == "percentage" else "Amount ($)",
-            value=st.session_state.adjusted_params.get("value", 0),
-            key="value_input"
-        )
-    
-    with cols[1]:
-        st.session_state.adjusted_params["min_spend"] = st.number_input(
-            "Minimum Spend ($)",
-            value=st.session_state.adjusted_params.get("min_spend", 0),
-            key="min_spend_input"
-        )
-        st.session_state.adjusted_params["duration_days"] = st.number_input(
-            "Duration (Days)",
-            value=st.session_state.adjusted_params.get("duration_days", 7),
-            key="duration_input"
-        )
-        if st.session_state.adjusted_params.get("max_redemptions"):
-            st.session_state.adjusted_params["max_redemptions"] = st.number_input(
-                "Max Redemptions",
-                value=st.session_state.adjusted_params.get("max_redemptions"),
-                key="max_redemptions_input"
-            )
-
-# Offer display component
-def display_offer(params):
-    end_date = datetime.now() + timedelta(days=params.get("duration_days", 7))
-    value_display = f"{params['value']}%" if params.get("value_type") == "percentage" else format_currency(params['value'])
-    
-    with st.container():
-        st.markdown("---")
-        st.subheader("🎉 Your Created Offer")
-        cols = st.columns([1, 3])
-        
-        with cols[0]:
-            icon = "💰" if params.get("offer_type") == "cashback" else "🏷️"
-            st.markdown(f"<h1 style='text-align: center;'>{icon}</h1>", unsafe_allow_html=True)
-        
-        with cols[1]:
-            st.markdown(f"""
-            **✨ {params.get('offer_name', 'Special Offer')}**  
-            💵 **{value_display}** {params.get('offer_type')}  
-            🛒 Min. spend: **{format_currency(params.get('min_spend', 0))}**  
-            ⏳ Valid until: **{end_date.strftime('%b %d, %Y')}**  
-            👥 For: **{params.get('audience', 'all customers').title()}**
-            """, unsafe_allow_html=True)
-            
-            if params.get("conditions"):
-                st.markdown("**Conditions:**")
-                for condition in params["conditions"]:
-                    st.markdown(f"- {condition}")
-    
-    st.markdown("---")
-    st.success("Offer updated successfully!")
-
 # Main workflow
 if st.button("Generate Offer") and user_prompt:
     with st.spinner("Creating your offer..."):
-        st.session_state.offer_params = extract_offer_parameters(user_prompt, openai_api_key)
-        st.session_state.adjusted_params = st.session_state.offer_params.copy()
-        st.session_state.offer_created = True
-        st.rerun()
+        offer_params = extract_offer_parameters(user_prompt, openai_api_key)
+        if offer_params:
+            st.session_state.offer_params = offer_params
+            st.session_state.adjusted_params = offer_params.copy()
+            st.session_state.offer_created = True
+            st.rerun()
 
 if st.session_state.offer_params:
     st.success("✅ Offer parameters extracted!")
     
     # Display raw parameters (with formatted currency)
-    params_display = st.session_state.offer_params.copy()
-    if 'min_spend' in params_display:
-        params_display['min_spend'] = format_currency(params_display['min_spend'])
-    st.json(params_display)
+    st.json({
+        **st.session_state.offer_params,
+        'min_spend': format_currency(st.session_state.offer_params.get('min_spend', 0))
+    })
 
 if st.session_state.offer_created and st.session_state.adjusted_params:
-    st.success("✅ Adjust the offer below and see changes in real-time:")
-    
-    # Edit form
-    offer_editor()
-    
-    # Display the CURRENTLY EDITED offer
-    display_offer(st.session_state.adjusted_params)
+    st.success("✅ Adjust the offer below and click Apply to update the preview:")
     
-    if st.button("🔄 Refresh Preview"):
-        st.rerun()
+    # Edit form and live preview
+    offer_editor_fragment()
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+import offer_common
+from offer_common import ExtractionBatcher, run_in_thread
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Replace both extraction calls with fakes that record what was sent.
+
+    The single (streamed) call blocks until ``release`` is set, so tests can
+    queue followers while the leader is still in flight.
+    """
+    calls = []
+    release = threading.Event()
+    batch_reply = {}
+
+    def fake_stream(prompt, api_key, on_delta=None):
+        calls.append(("single", api_key, prompt))
+        release.wait(5)
+        if on_delta:
+            on_delta(prompt)
+        return {"offer_name": prompt}
+
+    def fake_batch(prompts, api_key):
+        calls.append(("batch", api_key, tuple(prompts)))
+        if "error" in batch_reply:
+            raise batch_reply["error"]
+        return [{"offer_name": prompt} for prompt in prompts]
+
+    monkeypatch.setattr(offer_common, "stream_offer_parameters", fake_stream)
+    monkeypatch.setattr(offer_common, "request_offer_batch", fake_batch)
+    return calls, release, batch_reply
+
+
+def wait_for_queue(batcher, api_key, size):
+    deadline = time.monotonic() + 5
+    while len(batcher._pending.get(api_key) or ()) < size:
+        assert time.monotonic() < deadline, "followers were never queued"
+        time.sleep(0.01)
+
+
+def start_leader_and_followers(batcher, prompts, api_key="key"):
+    leader = run_in_thread(batcher.extract, prompts[0], api_key)
+    while api_key not in batcher._pending:
+        time.sleep(0.01)
+    followers = [run_in_thread(batcher.extract, p, api_key) for p in prompts[1:]]
+    wait_for_queue(batcher, api_key, len(followers))
+    return leader, followers
+
+
+def test_lone_request_is_streamed(api):
+    calls, release, _ = api
+    release.set()
+    deltas = []
+
+    result = ExtractionBatcher().extract("solo", "key", deltas.append)
+
+    assert result == {"offer_name": "solo"}
+    assert deltas == ["solo"]
+    assert calls == [("single", "key", "solo")]
+
+
+def test_queued_requests_go_out_in_ordered_batches(api):
+    calls, release, _ = api
+    batcher = ExtractionBatcher()
+    prompts = [f"p{i}" for i in range(11)]
+
+    leader, followers = start_leader_and_followers(batcher, prompts)
+    release.set()
+
+    assert leader.result(5) == {"offer_name": "p0"}
+    assert [f.result(5) for f in followers] == [{"offer_name": p} for p in prompts[1:]]
+    assert calls == [
+        ("single", "key", "p0"),
+        ("batch", "key", tuple(prompts[1:9])),
+        ("batch", "key", tuple(prompts[9:])),
+    ]
+    # The queue is torn down once drained, so the next request leads again
+    deadline = time.monotonic() + 5
+    while "key" in batcher._pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_malformed_batch_is_retried_per_prompt(api):
+    calls, release, batch_reply = api
+    batch_reply["error"] = ValueError("Expected 2 offers, got 1")
+    batcher = ExtractionBatcher()
+
+    leader, followers = start_leader_and_followers(batcher, ["a", "b", "c"])
+    release.set()
+
+    assert leader.result(5) == {"offer_name": "a"}
+    assert [f.result(5) for f in followers] == [{"offer_name": "b"}, {"offer_name": "c"}]
+    assert ("batch", "key", ("b", "c")) in calls
+    assert {c for c in calls if c[0] == "single"} == {
+        ("single", "key", "a"), ("single", "key", "b"), ("single", "key", "c")
+    }
+
+
+def test_api_error_fails_the_queued_batch(api):
+    _, release, batch_reply = api
+    batch_reply["error"] = RuntimeError("rate limited")
+    batcher = ExtractionBatcher()
+
+    leader, followers = start_leader_and_followers(batcher, ["a", "b", "c"])
+    release.set()
+
+    assert leader.result(5) == {"offer_name": "a"}
+    for follower in followers:
+        with pytest.raises(RuntimeError, match="rate limited"):
+            follower.result(5)
+
+
+def test_requests_for_other_keys_are_not_batched(api):
+    calls, release, _ = api
+    batcher = ExtractionBatcher()
+
+    first = run_in_thread(batcher.extract, "a", "key-1")
+    second = run_in_thread(batcher.extract, "b", "key-2")
+    deadline = time.monotonic() + 5
+    while len(calls) < 2:
+        assert time.monotonic() < deadline, "second key was held behind the first"
+        time.sleep(0.01)
+    release.set()
+
+    assert first.result(5) == {"offer_name": "a"}
+    assert second.result(5) == {"offer_name": "b"}
+    assert sorted(calls) == [("single", "key-1", "a"), ("single", "key-2", "b")]